@@ -14,6 +14,8 @@
 # limitations under the License.
 """MindSpore Funnel Transformer model."""
 
+import functools
+import math
 from dataclasses import dataclass
 from typing import List, Optional, Tuple, Union
 
@@ -61,16 +63,37 @@ FUNNEL_PRETRAINED_MODEL_ARCHIVE_LIST = [
 
 INF = 1e6
 
+
+@functools.lru_cache(maxsize=None)
+def _fanout_std(fan_in: int, fan_out: int) -> float:
+    """Std for the fan-based Linear init; a model only has a handful of unique
+    weight shapes, so cache the result instead of recomputing it per module."""
+    return math.sqrt(1.0 / (fan_in + fan_out))
+
 class FunnelEmbeddings(nn.Module):
     def __init__(self, config: FunnelConfig) -> None:
         super().__init__()
         self.word_embeddings = nn.Embedding(config.vocab_size, config.hidden_size, padding_idx=config.pad_token_id)
         self.layer_norm = nn.LayerNorm([config.d_model], eps=config.layer_norm_eps)
         self.dropout = nn.Dropout(p=config.hidden_dropout)
+        # Optional inference-only lookup table, see precompute_token_embeddings.
+        self._precomputed_embeddings = None
+
+    def precompute_token_embeddings(self) -> None:
+        """Precompute `layer_norm(word_embeddings)` for the whole vocabulary.
+
+        The embedding module has no position dependency, so at inference the normalized
+        embedding of a token id is fixed and can be gathered directly, skipping the
+        LayerNorm over every input sequence. The table is only used in eval mode; call
+        this again if the embedding or LayerNorm weights change.
+        """
+        self._precomputed_embeddings = self.layer_norm(self.word_embeddings.weight)
 
     def forward(
         self, input_ids: Optional[mindspore.Tensor] = None, inputs_embeds: Optional[mindspore.Tensor] = None
     ) -> mindspore.Tensor:
+        if inputs_embeds is None and not self.training and self._precomputed_embeddings is not None:
+            return self.dropout(F.embedding(input_ids, self._precomputed_embeddings))
         if inputs_embeds is None:
             inputs_embeds = self.word_embeddings(input_ids)
         embeddings = self.layer_norm(inputs_embeds)
@@ -85,6 +108,9 @@ class FunnelAttentionStructure(nn.Module):
 
     cls_token_type_id: int = 2
 
+    # Maximum number of (seq_len, dtype) entries kept in the sinusoidal table cache.
+    _pos_embed_cache_size: int = 8
+
     def __init__(self, config: FunnelConfig) -> None:
         super().__init__()
         self.config = config
@@ -93,6 +119,25 @@ class FunnelAttentionStructure(nn.Module):
         # Track where we are at in terms of pooling from the original input, e.g., by how much the sequence length was
         # divided.
         self.pooling_mult = None
+        # The sinusoidal tables are a deterministic function of (seq_len, dtype) and the config, so they are
+        # cached across forward passes. Dropout is still applied on every call, outside the cache.
+        self._pos_embed_cache = {}
+        # Same idea for the <cls> mask, which only depends on (seq_len, dtype).
+        self._cls_mask_cache = {}
+        # <cls> position of each pooled block (see stride_pool_pos), tabulated once.
+        self._pooled_cls_pos = [np.array([-(2**i) + 1], dtype=np.int64) for i in range(config.num_blocks + 1)]
+        # Inverse frequencies only depend on the config, compute them once instead of on every forward.
+        inv_freq = 1 / (
+            10000 ** (ops.arange(0, config.d_model // 2, dtype=mindspore.float32) / (config.d_model // 2))
+        )
+        self.register_buffer("inv_freq", inv_freq, persistent=False)
+
+    def _cache_pos_embed(self, key, value):
+        """Insert an entry in the bounded sinusoidal table cache, evicting the oldest one if full."""
+        if len(self._pos_embed_cache) >= self._pos_embed_cache_size:
+            self._pos_embed_cache.pop(next(iter(self._pos_embed_cache)))
+        self._pos_embed_cache[key] = value
+        return value
 
     def init_attention_inputs(
         self,
@@ -106,21 +151,39 @@ class FunnelAttentionStructure(nn.Module):
         self.pooling_mult = 1
         self.seq_len = seq_len = inputs_embeds.shape[1]
         position_embeds = self.get_position_embeds(seq_len, inputs_embeds.dtype)
-        token_type_mat = self.token_type_ids_to_mat(token_type_ids) if token_type_ids is not None else None
-        cls_mask = (
-            F.pad(inputs_embeds.new_ones([seq_len - 1, seq_len - 1]), (1, 0, 1, 0))
-            if self.config.separate_cls
-            else None
-        )
-        return (position_embeds, token_type_mat, attention_mask, cls_mask)
+        if token_type_ids is not None:
+            # Cast to the compute dtype once; the attention layers then reuse it as-is across
+            # all layers and repeats of a block instead of re-casting on every call.
+            token_type_mat = self.token_type_ids_to_mat(token_type_ids).astype(inputs_embeds.dtype)
+        else:
+            token_type_mat = None
+        cls_mask = self._get_cls_mask(inputs_embeds, seq_len) if self.config.separate_cls else None
+        additive_mask = self._additive_attention_mask(attention_mask)
+        return (position_embeds, token_type_mat, attention_mask, additive_mask, cls_mask)
+
+    def _get_cls_mask(self, inputs_embeds: mindspore.Tensor, seq_len: int) -> mindspore.Tensor:
+        """Build (or fetch from the bounded cache) the mask zeroing attention to/from <cls>."""
+        key = (seq_len, inputs_embeds.dtype)
+        cls_mask = self._cls_mask_cache.get(key)
+        if cls_mask is None:
+            cls_mask = F.pad(inputs_embeds.new_ones([seq_len - 1, seq_len - 1]), (1, 0, 1, 0))
+            if len(self._cls_mask_cache) >= self._pos_embed_cache_size:
+                self._cls_mask_cache.pop(next(iter(self._cls_mask_cache)))
+            self._cls_mask_cache[key] = cls_mask
+        return cls_mask
+
+    def _additive_attention_mask(self, attention_mask: Optional[mindspore.Tensor]) -> Optional[mindspore.Tensor]:
+        """Convert a 0/1 attention mask into the additive bias added to the attention scores."""
+        if attention_mask is None:
+            return None
+        return -INF * (1 - attention_mask[:, None, None].float())
 
     def token_type_ids_to_mat(self, token_type_ids: mindspore.Tensor) -> mindspore.Tensor:
         """Convert `token_type_ids` to `token_type_mat`."""
-        token_type_mat = token_type_ids[:, :, None] == token_type_ids[:, None]
         # Treat <cls> as in the same segment as both A & B
         cls_ids = token_type_ids == self.cls_token_type_id
-        cls_mat = cls_ids[:, :, None].int() | cls_ids[:, None].int()
-        return (cls_mat | token_type_mat.int()).bool()
+        # Single boolean expression, no int round-trips or extra full-size temporaries.
+        return (token_type_ids[:, :, None] == token_type_ids[:, None]) | cls_ids[:, :, None] | cls_ids[:, None]
 
     def get_position_embeds(
         self, seq_len: int, dtype: mindspore.dtype
@@ -138,16 +201,25 @@ class FunnelAttentionStructure(nn.Module):
         Paper link: https://arxiv.org/abs/2006.03236
         """
         d_model = self.config.d_model
+        cache_key = (
+            seq_len,
+            dtype,
+            self.config.attention_type,
+            self.config.num_blocks,
+            self.config.separate_cls,
+            self.config.truncate_seq,
+        )
+        cached = self._pos_embed_cache.get(cache_key)
         if self.config.attention_type == "factorized":
             # Notations from the paper, appending A.2.2, final formula.
             # We need to create and return the matrices phi, psi, pi and omega.
-            pos_seq = ops.arange(0, seq_len, 1.0, dtype=mindspore.int64).to(dtype)
-            freq_seq = ops.arange(0, d_model // 2, 1.0, dtype=mindspore.int64).to(dtype)
-            inv_freq = 1 / (10000 ** (freq_seq / (d_model // 2)))
-            sinusoid = pos_seq[:, None] * inv_freq[None]
-            sin_embed = ops.sin(sinusoid)
+            if cached is None:
+                pos_seq = ops.arange(0, seq_len, 1.0, dtype=dtype)
+                inv_freq = self.inv_freq.to(dtype)
+                sinusoid = pos_seq[:, None] * inv_freq[None]
+                cached = self._cache_pos_embed(cache_key, (ops.sin(sinusoid), ops.cos(sinusoid)))
+            sin_embed, cos_embed = cached
             sin_embed_d = self.sin_dropout(sin_embed)
-            cos_embed = ops.cos(sinusoid)
             cos_embed_d = self.cos_dropout(cos_embed)
             # This is different from the formula on the paper...
             phi = ops.cat([sin_embed_d, sin_embed_d], dim=-1)
@@ -158,53 +230,61 @@ class FunnelAttentionStructure(nn.Module):
         else:
             # Notations from the paper, appending A.2.1, final formula.
             # We need to create and return all the possible vectors R for all blocks and shifts.
-            freq_seq = ops.arange(0, d_model // 2, 1.0, dtype=mindspore.int64).to(dtype)
-            inv_freq = 1 / (10000 ** (freq_seq / (d_model // 2)))
-            # Maximum relative positions for the first input
-            rel_pos_id = ops.arange(-seq_len * 2, seq_len * 2, 1.0, dtype=mindspore.int64).to(dtype)
-            zero_offset = seq_len * 2
-            sinusoid = rel_pos_id[:, None] * inv_freq[None]
-            sin_embed = self.sin_dropout(ops.sin(sinusoid))
-            cos_embed = self.cos_dropout(ops.cos(sinusoid))
-            pos_embed = ops.cat([sin_embed, cos_embed], dim=-1)
+            if cached is None:
+                inv_freq = self.inv_freq.to(dtype)
+                # Maximum relative positions for the first input
+                rel_pos_id = ops.arange(-seq_len * 2, seq_len * 2, 1.0, dtype=dtype)
+                sinusoid = rel_pos_id[:, None] * inv_freq[None]
 
-            pos = ops.arange(0, seq_len, dtype=mindspore.int64).to(dtype)
-            pooled_pos = pos
-            position_embeds_list = []
-            for block_index in range(0, self.config.num_blocks):
                 # For each block with block_index > 0, we need two types position embeddings:
                 #   - Attention(pooled-q, unpooled-kv)
                 #   - Attention(pooled-q, pooled-kv)
                 # For block_index = 0 we only need the second one and leave the first one as None.
+                # The gather indices of all (block, shift) pairs are concatenated so the per-block
+                # embeddings can be sliced out of a single gather at call time.
+                zero_offset = seq_len * 2
+                pos = np.arange(0, seq_len, dtype=np.int64)
+                pooled_pos = pos
+                rel_pos_list = []
+                chunk_sizes = []
+                for block_index in range(0, self.config.num_blocks):
+                    # First type
+                    if block_index != 0:
+                        pooled_pos = self.stride_pool_pos(pos, block_index)
+
+                        # forward rel_pos_id
+                        stride = 2 ** (block_index - 1)
+                        rel_pos = self.relative_pos(pos, stride, pooled_pos, shift=2) + zero_offset
+                        rel_pos_list.append(rel_pos)
+                        chunk_sizes.append(rel_pos.shape[0])
+
+                    # Second type
+                    pos = pooled_pos
+                    stride = 2**block_index
+                    rel_pos = self.relative_pos(pos, stride) + zero_offset
+                    rel_pos_list.append(rel_pos)
+                    chunk_sizes.append(rel_pos.shape[0])
+                rel_pos_index = mindspore.Tensor(np.concatenate(rel_pos_list, axis=0))
+                cached = self._cache_pos_embed(
+                    cache_key, (ops.sin(sinusoid), ops.cos(sinusoid), rel_pos_index, chunk_sizes)
+                )
+            sin_embed = self.sin_dropout(cached[0])
+            cos_embed = self.cos_dropout(cached[1])
+            pos_embed = ops.cat([sin_embed, cos_embed], dim=-1)
 
-                # First type
-                if block_index == 0:
-                    position_embeds_pooling = None
-                else:
-                    pooled_pos = self.stride_pool_pos(pos, block_index)
-
-                    # forward rel_pos_id
-                    stride = 2 ** (block_index - 1)
-                    rel_pos = self.relative_pos(pos, stride, pooled_pos, shift=2)
-                    rel_pos = rel_pos[:, None] + zero_offset
-                    # rel_pos = rel_pos.expand(rel_pos.shape[0], d_model)
-                    rel_pos = rel_pos.broadcast_to((rel_pos.shape[0], d_model))
-                    position_embeds_pooling = ops.gather(pos_embed, 0, rel_pos)
-
-                # Second type
-                pos = pooled_pos
-                stride = 2**block_index
-                rel_pos = self.relative_pos(pos, stride)
-
-                rel_pos = rel_pos[:, None] + zero_offset
-                # rel_pos = rel_pos.expand(rel_pos.shape[0], d_model)
-                rel_pos = rel_pos.broadcast_to((rel_pos.shape[0], d_model))
-                position_embeds_no_pooling = ops.gather(pos_embed, 0, rel_pos)
-
+            rel_pos_index, chunk_sizes = cached[2], cached[3]
+            all_embeds = ops.gather(
+                pos_embed, 0, rel_pos_index[:, None].broadcast_to((rel_pos_index.shape[0], d_model))
+            )
+            chunks = list(ops.split(all_embeds, chunk_sizes, dim=0))
+            position_embeds_list = []
+            for block_index in range(0, self.config.num_blocks):
+                position_embeds_pooling = None if block_index == 0 else chunks.pop(0)
+                position_embeds_no_pooling = chunks.pop(0)
                 position_embeds_list.append([position_embeds_no_pooling, position_embeds_pooling])
             return position_embeds_list
 
-    def stride_pool_pos(self, pos_id: mindspore.Tensor, block_index: int):
+    def stride_pool_pos(self, pos_id: np.ndarray, block_index: int) -> np.ndarray:
         """
         Pool `pos_id` while keeping the cls token separate (if `config.separate_cls=True`).
         """
@@ -213,26 +293,28 @@ class FunnelAttentionStructure(nn.Module):
             # the previous block of the 1st real block. Since the 1st real
             # block always has position 1, the position of the previous block
             # will be at `1 - 2 ** block_index`.
-            # cls_pos = pos_id.new_tensor([-(2**block_index) + 1])
-            cls_pos = mindspore.Tensor([-(2**block_index) + 1], dtype=pos_id.dtype)
+            cls_pos = self._pooled_cls_pos[block_index]
             pooled_pos_id = pos_id[1:-1] if self.config.truncate_seq else pos_id[1:]
-            return ops.cat([cls_pos, pooled_pos_id[::2]], dim=0)
+            return np.concatenate([cls_pos, pooled_pos_id[::2]], axis=0)
         else:
             return pos_id[::2]
 
-    def relative_pos(self, pos: mindspore.Tensor, stride: int, pooled_pos=None, shift: int = 1) -> mindspore.Tensor:
+    def relative_pos(self, pos: np.ndarray, stride: int, pooled_pos=None, shift: int = 1) -> np.ndarray:
         """
         Build the relative positional vector between `pos` and `pooled_pos`.
+
+        The bounds are computed with Python ints on the host, so no device sync is needed
+        to size the resulting range.
         """
         if pooled_pos is None:
             pooled_pos = pos
 
-        ref_point = pooled_pos[0] - pos[0]
+        ref_point = int(pooled_pos[0]) - int(pos[0])
         num_remove = shift * len(pooled_pos)
         max_dist = ref_point + num_remove * stride
-        min_dist = pooled_pos[0] - pos[-1]
+        min_dist = int(pooled_pos[0]) - int(pos[-1])
 
-        return ops.arange(max_dist.item(), min_dist.item() - 1, -stride, dtype=mindspore.int64)
+        return np.arange(max_dist, min_dist - 1, -stride, dtype=np.int64)
 
     def stride_pool(
         self,
@@ -247,6 +329,14 @@ class FunnelAttentionStructure(nn.Module):
 
         # Do the stride pool recursively if axis is a list or a tuple of ints.
         if isinstance(axis, (list, tuple)):
+            if (
+                isinstance(tensor, mindspore.Tensor)
+                and len(axis) == 2
+                and axis[0] % tensor.ndim != axis[1] % tensor.ndim
+            ):
+                # Pooling two distinct axes commutes, so the <cls> concats can both be done
+                # up front and the two slicing passes merged into one double-strided slice.
+                return self._stride_pool_2d(tensor, axis)
             for ax in axis:
                 tensor = self.stride_pool(tensor, ax)
             return tensor
@@ -267,6 +357,23 @@ class FunnelAttentionStructure(nn.Module):
             tensor = ops.cat([tensor[cls_slice], tensor], dim=axis)
         return tensor[enc_slice]
 
+    def _stride_pool_2d(
+        self, tensor: mindspore.Tensor, axes: Union[Tuple[int], List[int]]
+    ) -> mindspore.Tensor:
+        """Stride-pool two distinct axes with a single combined slice."""
+        axis_slice = (
+            slice(None, -1, 2) if self.config.separate_cls and self.config.truncate_seq else slice(None, None, 2)
+        )
+        axes = [ax % tensor.ndim for ax in axes]
+        if self.config.separate_cls:
+            for ax in axes:
+                cls_slice = [slice(None)] * ax + [slice(None, 1)]
+                tensor = ops.cat([tensor[cls_slice], tensor], dim=ax)
+        enc_slice = [slice(None)] * tensor.ndim
+        for ax in axes:
+            enc_slice[ax] = axis_slice
+        return tensor[tuple(enc_slice)]
+
     def pool_tensor(
         self, tensor: Union[mindspore.Tensor, Tuple[mindspore.Tensor], List[mindspore.Tensor]], mode: str = "mean", stride: int = 2
     ) -> mindspore.Tensor:
@@ -282,6 +389,25 @@ class FunnelAttentionStructure(nn.Module):
             suffix = tensor[:, :-1] if self.config.truncate_seq else tensor
             tensor = ops.cat([tensor[:, :1], suffix], dim=1)
 
+        if stride == 2:
+            # Stride-2 pooling is just a pairwise reduction along the sequence axis: two slices
+            # and one elementwise op instead of a fake-2D pooling kernel plus reshapes.
+            odd_len = tensor.shape[1] % 2 == 1
+            even_slice = tensor[:, :-1:2] if odd_len else tensor[:, ::2]
+            odd_slice = tensor[:, 1::2]
+            if mode == "mean":
+                pooled = 0.5 * (even_slice + odd_slice)
+            elif mode == "max":
+                pooled = ops.maximum(even_slice, odd_slice)
+            elif mode == "min":
+                pooled = ops.minimum(even_slice, odd_slice)
+            else:
+                raise NotImplementedError("The supported modes are 'mean', 'max' and 'min'.")
+            if odd_len:
+                # ceil mode: the trailing element forms a window of its own.
+                pooled = ops.cat([pooled, tensor[:, -1:]], dim=1)
+            return pooled
+
         ndim = tensor.ndim
         if ndim == 2:
             tensor = tensor[:, None, :, None]
@@ -309,7 +435,7 @@ class FunnelAttentionStructure(nn.Module):
         self, output, attention_inputs: Tuple[mindspore.Tensor]
     ) -> Tuple[mindspore.Tensor, Tuple[mindspore.Tensor]]:
         """Pool `output` and the proper parts of `attention_inputs` before the attention layer."""
-        position_embeds, token_type_mat, attention_mask, cls_mask = attention_inputs
+        position_embeds, token_type_mat, attention_mask, additive_mask, cls_mask = attention_inputs
         if self.config.pool_q_only:
             if self.config.attention_type == "factorized":
                 position_embeds = self.stride_pool(position_embeds[:2], 0) + position_embeds[2:]
@@ -323,13 +449,14 @@ class FunnelAttentionStructure(nn.Module):
             token_type_mat = self.stride_pool(token_type_mat, [1, 2])
             cls_mask = self.stride_pool(cls_mask, [1, 2])
             attention_mask = self.pool_tensor(attention_mask, mode="min")
+            additive_mask = self._additive_attention_mask(attention_mask)
             output = self.pool_tensor(output, mode=self.config.pooling_type)
-        attention_inputs = (position_embeds, token_type_mat, attention_mask, cls_mask)
+        attention_inputs = (position_embeds, token_type_mat, attention_mask, additive_mask, cls_mask)
         return output, attention_inputs
 
     def post_attention_pooling(self, attention_inputs: Tuple[mindspore.Tensor]) -> Tuple[mindspore.Tensor]:
         """Pool the proper parts of `attention_inputs` after the attention layer."""
-        position_embeds, token_type_mat, attention_mask, cls_mask = attention_inputs
+        position_embeds, token_type_mat, attention_mask, additive_mask, cls_mask = attention_inputs
         if self.config.pool_q_only:
             self.pooling_mult *= 2
             if self.config.attention_type == "factorized":
@@ -337,7 +464,8 @@ class FunnelAttentionStructure(nn.Module):
             token_type_mat = self.stride_pool(token_type_mat, 2)
             cls_mask = self.stride_pool(cls_mask, 1)
             attention_mask = self.pool_tensor(attention_mask, mode="min")
-        attention_inputs = (position_embeds, token_type_mat, attention_mask, cls_mask)
+            additive_mask = self._additive_attention_mask(attention_mask)
+        attention_inputs = (position_embeds, token_type_mat, attention_mask, additive_mask, cls_mask)
         return attention_inputs
 
 
@@ -380,42 +508,73 @@ class FunnelRelMultiheadAttention(nn.Module):
         self.post_proj = nn.Linear(n_head * d_head, d_model)
         self.layer_norm = nn.LayerNorm([d_model], eps=config.layer_norm_eps)
         self.scale = 1.0 / (d_head**0.5)
+        # Eval-only cache of the projected positional encodings, keyed by shift. The position
+        # embeddings are cached upstream, so identity of `r` tells us whether the projection
+        # is still valid across the repeated layers of a block.
+        self._r_head_cache = {}
+        # Eval-only cache of the scale-multiplied biases; see _scaled_biases.
+        self._scaled_bias_cache = None
+
+    def train(self, mode: bool = True):
+        # Parameters can change while training, so drop the eval-only caches whenever
+        # the mode is toggled.
+        self._r_head_cache.clear()
+        self._scaled_bias_cache = None
+        return super().train(mode)
+
+    def _scaled_biases(self) -> Tuple[mindspore.Tensor, mindspore.Tensor, mindspore.Tensor]:
+        """Return (r_w_bias, r_r_bias, r_s_bias) pre-multiplied by the attention scale.
+
+        The scale is a constant, so in eval mode the products are computed once instead of
+        on every layer call.
+        """
+        if not self.training and self._scaled_bias_cache is not None:
+            return self._scaled_bias_cache
+        scaled = (self.r_w_bias * self.scale, self.r_r_bias * self.scale, self.r_s_bias * self.scale)
+        if not self.training:
+            self._scaled_bias_cache = scaled
+        return scaled
 
     def relative_positional_attention(self, position_embeds, q_head, context_len, cls_mask=None):
         """Relative attention score for the positional encodings"""
-        # q_head has shape batch_size x sea_len x n_head x d_head
+        # q_head has shape batch_size x sea_len x n_head x d_head and already includes the
+        # scaled r_r_bias (u/v in the paper), added once in forward.
         if self.config.attention_type == "factorized":
             # Notations from the paper, appending A.2.2, final formula (https://arxiv.org/abs/2006.03236)
             # phi and pi have shape seq_len x d_model, psi and omega have shape context_len x d_model
             phi, pi, psi, omega = position_embeds
-            # Shape n_head x d_head
-            u = self.r_r_bias * self.scale
             # Shape d_model x n_head x d_head
             w_r = self.r_kernel
 
             # Shape batch_size x sea_len x n_head x d_model
-            q_r_attention = ops.einsum("binh,dnh->bind", q_head + u, w_r)
-            q_r_attention_1 = q_r_attention * phi[:, None]
-            q_r_attention_2 = q_r_attention * pi[:, None]
+            q_r_attention = ops.matmul(q_head.swapaxes(1, 2), ops.permute(w_r, (1, 2, 0))).swapaxes(1, 2)
+            # The phi/psi and pi/omega contractions share the contracted axis, so concatenating
+            # along it turns the two einsums plus add into a single contraction:
+            # (q*phi) @ psi^T + (q*pi) @ omega^T == [q*phi | q*pi] @ [psi | omega]^T
+            q_r_attention = ops.cat([q_r_attention * phi[:, None], q_r_attention * pi[:, None]], dim=-1)
+            pos_kernel = ops.cat([psi, omega], dim=-1)
 
             # Shape batch_size x n_head x seq_len x context_len
-            positional_attn = ops.einsum("bind,jd->bnij", q_r_attention_1, psi) + ops.einsum(
-                "bind,jd->bnij", q_r_attention_2, omega
-            )
+            positional_attn = ops.matmul(q_r_attention.swapaxes(1, 2), pos_kernel.swapaxes(0, 1))
         else:
             shift = 2 if q_head.shape[1] != context_len else 1
             # Notations from the paper, appending A.2.1, final formula (https://arxiv.org/abs/2006.03236)
             # Grab the proper positional encoding, shape max_rel_len x d_model
             r = position_embeds[self.block_index][shift - 1]
-            # Shape n_head x d_head
-            v = self.r_r_bias * self.scale
             # Shape d_model x n_head x d_head
             w_r = self.r_kernel
 
-            # Shape max_rel_len x n_head x d_model
-            r_head = ops.einsum("td,dnh->tnh", r, w_r)
+            d_model, n_head, d_head = self.config.d_model, self.config.n_head, self.config.d_head
+            # Shape max_rel_len x n_head x d_head
+            cached = None if self.training else self._r_head_cache.get(shift)
+            if cached is not None and cached[0] is r:
+                r_head = cached[1]
+            else:
+                r_head = ops.matmul(r, w_r.reshape(d_model, n_head * d_head)).reshape(-1, n_head, d_head)
+                if not self.training:
+                    self._r_head_cache[shift] = (r, r_head)
             # Shape batch_size x n_head x seq_len x max_rel_len
-            positional_attn = ops.einsum("binh,tnh->bnit", q_head + v, r_head)
+            positional_attn = ops.matmul(q_head.swapaxes(1, 2), ops.permute(r_head, (1, 2, 0)))
             # Shape batch_size x n_head x seq_len x context_len
             positional_attn = _relative_shift_gather(positional_attn, context_len, shift)
 
@@ -427,23 +586,16 @@ class FunnelRelMultiheadAttention(nn.Module):
         """Relative attention score for the token_type_ids"""
         if token_type_mat is None:
             return 0
-        batch_size, seq_len, context_len = token_type_mat.shape
-        # q_head has shape batch_size x seq_len x n_head x d_head
-        # Shape n_head x d_head
-        r_s_bias = self.r_s_bias * self.scale
-
+        # q_head has shape batch_size x seq_len x n_head x d_head and already includes the
+        # scaled r_s_bias, added once in forward.
         # Shape batch_size x n_head x seq_len x 2
-        token_type_bias = ops.einsum("bind,snd->bnis", q_head + r_s_bias, self.seg_embed)
-        # Shape batch_size x n_head x seq_len x context_len
-        token_type_mat = token_type_mat[:, None].broadcast_to((batch_size, q_head.shape[2], seq_len, context_len))
-        # Shapes batch_size x n_head x seq_len
+        token_type_bias = ops.matmul(q_head.swapaxes(1, 2), ops.permute(self.seg_embed, (1, 2, 0)))
+        # Shapes batch_size x n_head x seq_len x 1
         diff_token_type, same_token_type = ops.split(token_type_bias, 1, dim=-1)
         # Shape batch_size x n_head x seq_len x context_len
-        # ops.Print(token_type_mat)
-        token_type_mat = token_type_mat.astype(mindspore.bool_)
-        token_type_attn = ops.where(
-            token_type_mat, same_token_type.broadcast_to(token_type_mat.shape), diff_token_type.broadcast_to(token_type_mat.shape)
-        )
+        # Branchless form of where(token_type_mat, same, diff): a single multiply-add with
+        # the mask already in the attention dtype (cast once in init_attention_inputs).
+        token_type_attn = diff_token_type + (same_token_type - diff_token_type) * token_type_mat[:, None]
 
         if cls_mask is not None:
             token_type_attn *= cls_mask
@@ -459,41 +611,89 @@ class FunnelRelMultiheadAttention(nn.Module):
     ) -> Tuple[mindspore.Tensor, ...]:
         # query has shape batch_size x seq_len x d_model
         # key and value have shapes batch_size x context_len x d_model
-        position_embeds, token_type_mat, attention_mask, cls_mask = attention_inputs
+        position_embeds, token_type_mat, attention_mask, additive_mask, cls_mask = attention_inputs
 
         batch_size, seq_len, _ = query.shape
         context_len = key.shape[1]
         n_head, d_head = self.config.n_head, self.config.d_head
 
-        # Shape batch_size x seq_len x n_head x d_head
-        q_head = self.q_head(query).view(batch_size, seq_len, n_head, d_head)
-        # Shapes batch_size x context_len x n_head x d_head
-        k_head = self.k_head(key).view(batch_size, context_len, n_head, d_head)
-        v_head = self.v_head(value).view(batch_size, context_len, n_head, d_head)
-
-        q_head = q_head * self.scale
-        # Shape n_head x d_head
-        r_w_bias = self.r_w_bias * self.scale
+        if (
+            query is key
+            and key is value
+            and isinstance(self.q_head, nn.Linear)
+            and isinstance(self.k_head, nn.Linear)
+            and isinstance(self.v_head, nn.Linear)
+        ):
+            # Self-attention without pooling: run the three projections as one fused GEMM
+            # and add the k/v biases after the split (q_head has no bias). Only plain
+            # Linear heads expose the weights needed for the fusion; quantized
+            # replacements fall through to the per-module projections below.
+            qkv = F.linear(query, ops.cat([self.q_head.weight, self.k_head.weight, self.v_head.weight], dim=0))
+            q_head, k_head, v_head = ops.split(qkv, n_head * d_head, dim=-1)
+            # Shape batch_size x seq_len x n_head x d_head
+            q_head = q_head.view(batch_size, seq_len, n_head, d_head)
+            # Shapes batch_size x context_len x n_head x d_head
+            k_head = (k_head + self.k_head.bias).view(batch_size, context_len, n_head, d_head)
+            v_head = (v_head + self.v_head.bias).view(batch_size, context_len, n_head, d_head)
+        else:
+            # Shape batch_size x seq_len x n_head x d_head
+            q_head = self.q_head(query).view(batch_size, seq_len, n_head, d_head)
+            # Shapes batch_size x context_len x n_head x d_head
+            k_head = self.k_head(key).view(batch_size, context_len, n_head, d_head)
+            v_head = self.v_head(value).view(batch_size, context_len, n_head, d_head)
+
+        # Add the scaled r_r/r_s biases with a single broadcast add so the large q_head
+        # tensor is only read once; the content bias r_w is handled per path below.
+        r_w_bias, r_r_bias, r_s_bias = self._scaled_biases()
+        scaled_q = q_head * self.scale
+        biases = ops.stack([r_r_bias, r_s_bias], dim=0)[:, None, None]
+        q_r, q_s = ops.unbind(scaled_q[None] + biases, dim=0)
         # Shapes batch_size x n_head x seq_len x context_len
-        content_score = ops.einsum("bind,bjnd->bnij", q_head + r_w_bias, k_head)
-        positional_attn = self.relative_positional_attention(position_embeds, q_head, context_len, cls_mask)
-        token_type_attn = self.relative_token_type_attention(token_type_mat, q_head, cls_mask)
-
-        # merge attention scores
-        attn_score = content_score + positional_attn + token_type_attn
-
-        # precision safe in case of mixed precision training
-        dtype = attn_score.dtype
-        attn_score = attn_score.float()
-        # perform masking
-        if attention_mask is not None:
-            attn_score = attn_score - INF * (1 - attention_mask[:, None, None].float())
-        # attention probability
-        attn_prob = ops.softmax(attn_score, dim=-1, dtype=dtype)
-        attn_prob = self.attention_dropout(attn_prob)
-
-        # attention output, shape batch_size x seq_len x n_head x d_head
-        attn_vec = ops.einsum("bnij,bjnd->bind", attn_prob, v_head)
+        positional_attn = self.relative_positional_attention(position_embeds, q_r, context_len, cls_mask)
+        token_type_attn = self.relative_token_type_attention(token_type_mat, q_s, cls_mask)
+        # The positional and token-type scores act as an additive bias on the content scores.
+        attn_bias = positional_attn + token_type_attn
+
+        if not output_attentions:
+            # Fused scale+bias+softmax+matmul attention; the kernel applies the
+            # 1/sqrt(d_head) scaling itself, so feed the unscaled query with the
+            # unscaled content bias.
+            if additive_mask is not None:
+                attn_bias = attn_bias + additive_mask
+            if attn_bias.dtype != q_head.dtype:
+                # Clamp before the downcast: the -INF padding bias overflows to
+                # -inf in float16, which would turn fully-masked rows into NaNs.
+                finfo_min = float(np.finfo(mindspore.dtype_to_nptype(q_head.dtype)).min)
+                attn_bias = ops.clamp(attn_bias, min=finfo_min).astype(q_head.dtype)
+            attn_vec = F.scaled_dot_product_attention(
+                (q_head + self.r_w_bias).swapaxes(1, 2),
+                k_head.swapaxes(1, 2),
+                v_head.swapaxes(1, 2),
+                attn_bias,
+                self.config.attention_dropout if self.training else 0.0,
+                False,
+            ).swapaxes(1, 2)
+        else:
+            # Eager path, kept for callers that need the attention probabilities.
+            q_w = scaled_q + r_w_bias
+            # Shape batch_size x n_head x seq_len x context_len
+            content_score = ops.matmul(q_w.swapaxes(1, 2), ops.permute(k_head, (0, 2, 3, 1)))
+            attn_score = content_score + attn_bias
+
+            # precision safe in case of mixed precision training: masking and softmax run in FP32.
+            # When the scores already are FP32 the upcast would just be a full-tensor copy.
+            dtype = attn_score.dtype
+            if dtype != mindspore.float32:
+                attn_score = attn_score.float()
+            # perform masking with the bias precomputed once per block
+            if additive_mask is not None:
+                attn_score = attn_score + additive_mask
+            # attention probability
+            attn_prob = ops.softmax(attn_score, dim=-1, dtype=dtype)
+            attn_prob = self.attention_dropout(attn_prob)
+
+            # attention output, shape batch_size x seq_len x n_head x d_head
+            attn_vec = ops.matmul(attn_prob, v_head.swapaxes(1, 2)).swapaxes(1, 2)
 
         # Shape shape batch_size x seq_len x d_model
         attn_out = self.post_proj(attn_vec.reshape(batch_size, seq_len, n_head * d_head))
@@ -553,6 +753,14 @@ class FunnelEncoder(nn.Module):
             ]
         )
 
+    def compile(self, *args, **kwargs):
+        # Regional compilation: the repeated attention+FFN layers dominate the runtime and
+        # all share the same structure, so compile them individually and keep the pooling
+        # glue around them eager.
+        for block in self.blocks:
+            for layer in block:
+                layer.compile(*args, **kwargs)
+
     def forward(
         self,
         inputs_embeds: mindspore.Tensor,
@@ -560,6 +768,7 @@ class FunnelEncoder(nn.Module):
         token_type_ids: Optional[mindspore.Tensor] = None,
         output_attentions: bool = False,
         output_hidden_states: bool = False,
+        hidden_states_to_return: Optional[Tuple[int, ...]] = None,
         return_dict: bool = True,
     ) -> Union[Tuple, BaseModelOutput]:
         # The pooling is not implemented on long tensors, so we convert this mask.
@@ -570,8 +779,17 @@ class FunnelEncoder(nn.Module):
             token_type_ids=token_type_ids,
         )
         hidden = inputs_embeds
-        all_hidden_states = (inputs_embeds,) if output_hidden_states else None
+        # `hidden_states_to_return` selects individual hidden states (0 being the
+        # embedding output) to capture without keeping the whole stack alive, for
+        # callers that only need a specific layer (e.g. the decoder input).
+        if output_hidden_states:
+            all_hidden_states = (inputs_embeds,)
+        elif hidden_states_to_return is not None:
+            all_hidden_states = (inputs_embeds,) if 0 in hidden_states_to_return else ()
+        else:
+            all_hidden_states = None
         all_attentions = () if output_attentions else None
+        hidden_index = 0
 
         for block_index, block in enumerate(self.blocks):
             pooling_flag = hidden.shape[1] > (2 if self.config.separate_cls else 1)
@@ -595,7 +813,10 @@ class FunnelEncoder(nn.Module):
 
                     if output_attentions:
                         all_attentions = all_attentions + layer_output[1:]
-                    if output_hidden_states:
+                    hidden_index += 1
+                    if output_hidden_states or (
+                        hidden_states_to_return is not None and hidden_index in hidden_states_to_return
+                    ):
                         all_hidden_states = all_hidden_states + (hidden,)
 
         if not return_dict:
@@ -614,7 +835,10 @@ def upsample(
     if separate_cls:
         cls = x[:, :1]
         x = x[:, 1:]
-    output = ops.repeat_interleave(x, repeats=stride, dim=1)
+    # Equivalent to repeat_interleave along the sequence axis, but broadcast over a new axis
+    # and merged back so backends can keep it a view until the next consumer.
+    batch_size, seq_len, d_model = x.shape
+    output = x[:, :, None].broadcast_to((batch_size, seq_len, stride, d_model)).reshape(batch_size, seq_len * stride, d_model)
     if separate_cls:
         if truncate_seq:
             output = ops.pad(output, (0, 0, 0, stride - 1, 0, 0))
@@ -632,6 +856,11 @@ class FunnelDecoder(nn.Module):
         self.attention_structure = FunnelAttentionStructure(config)
         self.layers = nn.ModuleList([FunnelLayer(config, 0) for _ in range(config.num_decoder_layers)])
 
+    def compile(self, *args, **kwargs):
+        # Regional compilation, mirroring FunnelEncoder.compile.
+        for layer in self.layers:
+            layer.compile(*args, **kwargs)
+
     def forward(
         self,
         final_hidden: mindspore.Tensor,
@@ -681,11 +910,12 @@ class FunnelDiscriminatorPredictions(nn.Module):
         super().__init__()
         self.config = config
         self.dense = nn.Linear(config.d_model, config.d_model)
+        self.act = ACT2FN[config.hidden_act]
         self.dense_prediction = nn.Linear(config.d_model, 1)
 
     def forward(self, discriminator_hidden_states: mindspore.Tensor) -> mindspore.Tensor:
         hidden_states = self.dense(discriminator_hidden_states)
-        hidden_states = ACT2FN[self.config.hidden_act](hidden_states)
+        hidden_states = self.act(hidden_states)
         logits = self.dense_prediction(hidden_states).squeeze(-1)
         return logits
 
@@ -699,29 +929,73 @@ class FunnelPreTrainedModel(PreTrainedModel):
     config_class = FunnelConfig
     base_model_prefix = "funnel"
 
+    # Bound on the number of input shapes for which default masks are kept.
+    _default_input_cache_size = 8
+
+    def _default_inputs(self, input_shape):
+        """Constant all-ones attention mask and all-zeros token type ids used when
+        the caller omits them, cached by shape so fixed-shape inference does not
+        reallocate them on every forward."""
+        key = tuple(input_shape)
+        cached = self._default_input_cache.get(key)
+        if cached is None:
+            cached = (ops.ones(input_shape), ops.zeros(input_shape, dtype=mindspore.int64))
+            if len(self._default_input_cache) >= self._default_input_cache_size:
+                self._default_input_cache.pop(next(iter(self._default_input_cache)))
+            self._default_input_cache[key] = cached
+        return cached
+
+    def quantize(self, quant_type: str = "W8"):
+        """Replace every `nn.Linear` with an int8 weight-quantized variant for inference.
+
+        `quant_type` picks one of the `mindnlp.quant.smooth_quant` linear classes;
+        the default "W8" quantizes only the weights (per-output-channel scales) and
+        keeps activations in floating point, halving the weight bytes read by the
+        memory-bound linear layers.
+        """
+        # Imported lazily so the quant stack is only pulled in when requested.
+        from ....quant.smooth_quant.quant import quant_cls
+
+        def _replace(module):
+            for name, child in module.named_children():
+                if isinstance(child, nn.Linear):
+                    setattr(module, name, quant_cls[quant_type](child.weight, child.bias))
+                else:
+                    _replace(child)
+
+        _replace(self)
+        return self
+
     def _init_weights(self, module):
         classname = module.__class__.__name__
         if classname.find("Linear") != -1:
             if getattr(module, "weight", None) is not None:
                 if self.config.initializer_std is None:
                     fan_out, fan_in = module.weight.shape
-                    std = np.sqrt(1.0 / float(fan_in + fan_out))
+                    std = _fanout_std(fan_in, fan_out)
                 else:
                     std = self.config.initializer_std
                 nn.init.normal_(module.weight, std=std)
             if getattr(module, "bias", None) is not None:
                 nn.init.constant_(module.bias, 0.0)
         elif classname == "FunnelRelMultiheadAttention":
-            nn.init.uniform_(module.r_w_bias, b=self.config.initializer_range)
-            nn.init.uniform_(module.r_r_bias, b=self.config.initializer_range)
-            nn.init.uniform_(module.r_kernel, b=self.config.initializer_range)
-            nn.init.uniform_(module.r_s_bias, b=self.config.initializer_range)
-            nn.init.uniform_(module.seg_embed, b=self.config.initializer_range)
+            # Draw all five relative-attention parameters from one flat RNG call
+            # instead of launching a separate initializer per parameter.
+            params = [module.r_w_bias, module.r_r_bias, module.r_kernel, module.r_s_bias, module.seg_embed]
+            flat = np.random.uniform(0.0, self.config.initializer_range, sum(p.numel() for p in params))
+            offset = 0
+            for param in params:
+                numel = param.numel()
+                param.data_sync(True)
+                param.assign_value(
+                    mindspore.Tensor(flat[offset : offset + numel].reshape(param.shape), dtype=param.dtype)
+                )
+                offset += numel
         elif classname == "FunnelEmbeddings":
             std = 1.0 if self.config.initializer_std is None else self.config.initializer_std
             nn.init.normal_(module.word_embeddings.weight, std=std)
             if module.word_embeddings.padding_idx is not None:
-                module.word_embeddings.weight.data[module.padding_idx] = 0
+                module.word_embeddings.weight[module.word_embeddings.padding_idx] = 0
 
 
 class FunnelClassificationHead(nn.Module):
@@ -752,6 +1026,7 @@ class FunnelBaseModel(FunnelPreTrainedModel):
 
         self.embeddings = FunnelEmbeddings(config)
         self.encoder = FunnelEncoder(config)
+        self._default_input_cache = {}
 
         # Initialize weights and apply final processing
         self.post_init()
@@ -762,6 +1037,9 @@ class FunnelBaseModel(FunnelPreTrainedModel):
     def set_input_embeddings(self, new_embeddings: nn.Embedding) -> None:
         self.embeddings.word_embeddings = new_embeddings
 
+    def compile(self, *args, **kwargs):
+        self.encoder.compile(*args, **kwargs)
+
     def forward(
         self,
         input_ids: Optional[mindspore.Tensor] = None,
@@ -792,10 +1070,12 @@ class FunnelBaseModel(FunnelPreTrainedModel):
 
         # device = input_ids.device if input_ids is not None else inputs_embeds.device
 
-        if attention_mask is None:
-            attention_mask = ops.ones(input_shape)
-        if token_type_ids is None:
-            token_type_ids = ops.zeros(input_shape, dtype=mindspore.int64)
+        if attention_mask is None or token_type_ids is None:
+            default_mask, default_token_type_ids = self._default_inputs(input_shape)
+            if attention_mask is None:
+                attention_mask = default_mask
+            if token_type_ids is None:
+                token_type_ids = default_token_type_ids
 
         # TODO: deal with head_mask
         inputs_embeds = self.embeddings(input_ids, inputs_embeds=inputs_embeds)
@@ -819,6 +1099,7 @@ class FunnelModel(FunnelPreTrainedModel):
         self.embeddings = FunnelEmbeddings(config)
         self.encoder = FunnelEncoder(config)
         self.decoder = FunnelDecoder(config)
+        self._default_input_cache = {}
 
         # Initialize weights and apply final processing
         self.post_init()
@@ -829,12 +1110,17 @@ class FunnelModel(FunnelPreTrainedModel):
     def set_input_embeddings(self, new_embeddings: nn.Embedding) -> None:
         self.embeddings.word_embeddings = new_embeddings
 
+    def compile(self, *args, **kwargs):
+        self.encoder.compile(*args, **kwargs)
+        self.decoder.compile(*args, **kwargs)
+
     def forward(
         self,
         input_ids: Optional[mindspore.Tensor] = None,
         attention_mask: Optional[mindspore.Tensor] = None,
         token_type_ids: Optional[mindspore.Tensor] = None,
         inputs_embeds: Optional[mindspore.Tensor] = None,
+        encoder_outputs: Optional[Union[Tuple, BaseModelOutput]] = None,
         output_attentions: Optional[bool] = None,
         output_hidden_states: Optional[bool] = None,
         return_dict: Optional[bool] = None,
@@ -860,26 +1146,36 @@ class FunnelModel(FunnelPreTrainedModel):
 
         # device = input_ids.device if input_ids is not None else inputs_embeds.device
 
-        if attention_mask is None:
-            attention_mask = ops.ones(input_shape)
-        if token_type_ids is None:
-            token_type_ids = ops.zeros(input_shape, dtype=mindspore.int64)
-
-        # TODO: deal with head_mask
-        inputs_embeds = self.embeddings(input_ids, inputs_embeds=inputs_embeds)
-
-        encoder_outputs = self.encoder(
-            inputs_embeds,
-            attention_mask=attention_mask,
-            token_type_ids=token_type_ids,
-            output_attentions=output_attentions,
-            output_hidden_states=True,
-            return_dict=return_dict,
-        )
+        if attention_mask is None or token_type_ids is None:
+            default_mask, default_token_type_ids = self._default_inputs(input_shape)
+            if attention_mask is None:
+                attention_mask = default_mask
+            if token_type_ids is None:
+                token_type_ids = default_token_type_ids
+
+        if encoder_outputs is None:
+            # TODO: deal with head_mask
+            inputs_embeds = self.embeddings(input_ids, inputs_embeds=inputs_embeds)
+
+            # The decoder only needs the first-block output; unless the caller
+            # asked for all hidden states, capture just that one instead of
+            # keeping the whole stack alive.
+            encoder_outputs = self.encoder(
+                inputs_embeds,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+                output_attentions=output_attentions,
+                output_hidden_states=output_hidden_states,
+                hidden_states_to_return=None if output_hidden_states else (self.config.block_sizes[0],),
+                return_dict=return_dict,
+            )
+            first_block_hidden = encoder_outputs[1][self.config.block_sizes[0] if output_hidden_states else 0]
+        else:
+            first_block_hidden = encoder_outputs[1][self.config.block_sizes[0]]
 
         decoder_outputs = self.decoder(
             final_hidden=encoder_outputs[0],
-            first_block_hidden=encoder_outputs[1][self.config.block_sizes[0]],
+            first_block_hidden=first_block_hidden,
             attention_mask=attention_mask,
             token_type_ids=token_type_ids,
             output_attentions=output_attentions,
@@ -888,15 +1184,13 @@ class FunnelModel(FunnelPreTrainedModel):
         )
 
         if not return_dict:
-            idx = 0
-            outputs = (decoder_outputs[0],)
-            if output_hidden_states:
-                idx += 1
-                outputs = outputs + (encoder_outputs[1] + decoder_outputs[idx],)
-            if output_attentions:
-                idx += 1
-                outputs = outputs + (encoder_outputs[2] + decoder_outputs[idx],)
-            return outputs
+            hidden_states = (encoder_outputs[1] + decoder_outputs[1],) if output_hidden_states else ()
+            attentions = (
+                (encoder_outputs[2] + decoder_outputs[2 if output_hidden_states else 1],)
+                if output_attentions
+                else ()
+            )
+            return (decoder_outputs[0],) + hidden_states + attentions
 
         return BaseModelOutput(
             last_hidden_state=decoder_outputs[0],
@@ -913,9 +1207,17 @@ class FunnelForPreTraining(FunnelPreTrainedModel):
 
         self.funnel = FunnelModel(config)
         self.discriminator_predictions = FunnelDiscriminatorPredictions(config)
+        self.bce_loss = nn.BCEWithLogitsLoss(reduction="none")
         # Initialize weights and apply final processing
         self.post_init()
 
+    def compile(self, *args, **kwargs):
+        self.funnel.compile(*args, **kwargs)
+        # The dense -> activation -> dense head is memory-bound on the full
+        # [batch, seq_len, d_model] tensor; compiling it fuses the activation
+        # and squeeze into the surrounding projections.
+        self.discriminator_predictions.compile(*args, **kwargs)
+
     def forward(
         self,
         input_ids: Optional[mindspore.Tensor] = None,
@@ -968,14 +1270,16 @@ class FunnelForPreTraining(FunnelPreTrainedModel):
 
         loss = None
         if labels is not None:
-            loss_fct = nn.BCEWithLogitsLoss()
+            seq_len = int(discriminator_sequence_output.shape[1])
+            losses = self.bce_loss(logits.view(-1, seq_len), labels.float())
             if attention_mask is not None:
-                active_loss = attention_mask.view(-1, discriminator_sequence_output.shape[1]) == 1
-                active_logits = logits.view(-1, discriminator_sequence_output.shape[1])[active_loss]
-                active_labels = labels[active_loss]
-                loss = loss_fct(active_logits, active_labels.float())
+                # Masked mean over the active tokens; masking keeps the shapes
+                # static, unlike a boolean gather whose output size depends on
+                # the mask contents.
+                mask = attention_mask.view(-1, seq_len).astype(losses.dtype)
+                loss = (losses * mask).sum() / ops.clamp(mask.sum(), min=1.0)
             else:
-                loss = loss_fct(logits.view(-1, discriminator_sequence_output.shape[1]), labels.float())
+                loss = losses.mean()
 
         if not return_dict:
             output = (logits,) + discriminator_hidden_states[1:]
@@ -989,6 +1293,20 @@ class FunnelForPreTraining(FunnelPreTrainedModel):
         )
 
 
+def _ce_loss(
+    loss_fct: nn.CrossEntropyLoss, logits: mindspore.Tensor, labels: mindspore.Tensor, num_labels: int
+) -> mindspore.Tensor:
+    """Cross-entropy over flattened logits/labels.
+
+    Uses `reshape` rather than `view` (tolerant to non-contiguous logits) and
+    only casts the labels when their dtype does not already match. The loss
+    module is passed in so heads can construct it once instead of per step.
+    """
+    if labels.dtype != mindspore.int32:
+        labels = labels.astype(mindspore.int32)
+    return loss_fct(logits.reshape(-1, num_labels), labels.reshape(-1))
+
+
 class FunnelForMaskedLM(FunnelPreTrainedModel):
     _tied_weights_keys = ["lm_head.weight"]
 
@@ -997,6 +1315,7 @@ class FunnelForMaskedLM(FunnelPreTrainedModel):
 
         self.funnel = FunnelModel(config)
         self.lm_head = nn.Linear(config.d_model, config.vocab_size)
+        self.ce_loss = nn.CrossEntropyLoss()
 
         # Initialize weights and apply final processing
         self.post_init()
@@ -1042,9 +1361,8 @@ class FunnelForMaskedLM(FunnelPreTrainedModel):
 
         masked_lm_loss = None
         if labels is not None:
-            loss_fct = nn.CrossEntropyLoss()  # -100 index = padding token
-            labels = labels.astype(mindspore.int32)
-            masked_lm_loss = loss_fct(prediction_logits.view(-1, self.config.vocab_size), labels.view(-1))
+            # -100 index = padding token
+            masked_lm_loss = _ce_loss(self.ce_loss, prediction_logits, labels, self.config.vocab_size)
 
         if not return_dict:
             output = (prediction_logits,) + outputs[1:]
@@ -1066,9 +1384,18 @@ class FunnelForSequenceClassification(FunnelPreTrainedModel):
 
         self.funnel = FunnelBaseModel(config)
         self.classifier = FunnelClassificationHead(config, config.num_labels)
+        self.mse_loss = nn.MSELoss()
+        self.ce_loss = nn.CrossEntropyLoss()
+        self.bce_loss = nn.BCEWithLogitsLoss()
         # Initialize weights and apply final processing
         self.post_init()
 
+    def compile(self, *args, **kwargs):
+        self.funnel.compile(*args, **kwargs)
+        # The two-layer classification head is memory-bound; compiling it fuses
+        # the tanh and dropout into the surrounding projections.
+        self.classifier.compile(*args, **kwargs)
+
     def forward(
         self,
         input_ids: Optional[mindspore.Tensor] = None,
@@ -1100,7 +1427,7 @@ class FunnelForSequenceClassification(FunnelPreTrainedModel):
         )
 
         last_hidden_state = outputs[0]
-        pooled_output = last_hidden_state[:, 0]
+        pooled_output = ops.narrow(last_hidden_state, 1, 0, 1).squeeze(1)
         logits = self.classifier(pooled_output)
 
         loss = None
@@ -1114,18 +1441,14 @@ class FunnelForSequenceClassification(FunnelPreTrainedModel):
                     self.config.problem_type = "multi_label_classification"
 
             if self.config.problem_type == "regression":
-                loss_fct = nn.MSELoss()
                 if self.num_labels == 1:
-                    loss = loss_fct(logits.squeeze(), labels.squeeze())
+                    loss = self.mse_loss(logits.squeeze(), labels.squeeze())
                 else:
-                    loss = loss_fct(logits, labels)
+                    loss = self.mse_loss(logits, labels)
             elif self.config.problem_type == "single_label_classification":
-                loss_fct = nn.CrossEntropyLoss()
-                labels = labels.astype(mindspore.int32)
-                loss = loss_fct(logits.view(-1, self.num_labels), labels.view(-1))
+                loss = _ce_loss(self.ce_loss, logits, labels, self.num_labels)
             elif self.config.problem_type == "multi_label_classification":
-                loss_fct = nn.BCEWithLogitsLoss()
-                loss = loss_fct(logits, labels)
+                loss = self.bce_loss(logits, labels)
 
         if not return_dict:
             output = (logits,) + outputs[1:]
@@ -1145,9 +1468,14 @@ class FunnelForMultipleChoice(FunnelPreTrainedModel):
 
         self.funnel = FunnelBaseModel(config)
         self.classifier = FunnelClassificationHead(config, 1)
+        self.ce_loss = nn.CrossEntropyLoss()
         # Initialize weights and apply final processing
         self.post_init()
 
+    def compile(self, *args, **kwargs):
+        self.funnel.compile(*args, **kwargs)
+        self.classifier.compile(*args, **kwargs)
+
     def forward(
         self,
         input_ids: Optional[mindspore.Tensor] = None,
@@ -1169,14 +1497,22 @@ class FunnelForMultipleChoice(FunnelPreTrainedModel):
         return_dict = return_dict if return_dict is not None else self.config.use_return_dict
         num_choices = input_ids.shape[1] if input_ids is not None else inputs_embeds.shape[1]
 
-        input_ids = input_ids.view(-1, input_ids.shape[-1]) if input_ids is not None else None
-        attention_mask = attention_mask.view(-1, attention_mask.shape[-1]) if attention_mask is not None else None
-        token_type_ids = token_type_ids.view(-1, token_type_ids.shape[-1]) if token_type_ids is not None else None
-        inputs_embeds = (
-            inputs_embeds.view(-1, inputs_embeds.shape[-2], inputs_embeds.shape[-1])
-            if inputs_embeds is not None
-            else None
-        )
+        if num_choices == 1:
+            # Single-choice scoring: dropping the choice axis is a pure view,
+            # no need for the four flattening reshapes below.
+            input_ids = input_ids.squeeze(1) if input_ids is not None else None
+            attention_mask = attention_mask.squeeze(1) if attention_mask is not None else None
+            token_type_ids = token_type_ids.squeeze(1) if token_type_ids is not None else None
+            inputs_embeds = inputs_embeds.squeeze(1) if inputs_embeds is not None else None
+        else:
+            input_ids = input_ids.view(-1, input_ids.shape[-1]) if input_ids is not None else None
+            attention_mask = attention_mask.view(-1, attention_mask.shape[-1]) if attention_mask is not None else None
+            token_type_ids = token_type_ids.view(-1, token_type_ids.shape[-1]) if token_type_ids is not None else None
+            inputs_embeds = (
+                inputs_embeds.view(-1, inputs_embeds.shape[-2], inputs_embeds.shape[-1])
+                if inputs_embeds is not None
+                else None
+            )
 
         outputs = self.funnel(
             input_ids,
@@ -1189,15 +1525,15 @@ class FunnelForMultipleChoice(FunnelPreTrainedModel):
         )
 
         last_hidden_state = outputs[0]
-        pooled_output = last_hidden_state[:, 0]
+        pooled_output = ops.narrow(last_hidden_state, 1, 0, 1).squeeze(1)
         logits = self.classifier(pooled_output)
-        reshaped_logits = logits.view(-1, num_choices)
+        reshaped_logits = logits if num_choices == 1 else logits.view(-1, num_choices)
 
         loss = None
         if labels is not None:
-            loss_fct = nn.CrossEntropyLoss()
-            labels = labels.astype(mindspore.int32)
-            loss = loss_fct(reshaped_logits, labels)
+            if labels.dtype != mindspore.int32:
+                labels = labels.astype(mindspore.int32)
+            loss = self.ce_loss(reshaped_logits, labels)
 
         if not return_dict:
             output = (reshaped_logits,) + outputs[1:]
@@ -1219,6 +1555,7 @@ class FunnelForTokenClassification(FunnelPreTrainedModel):
         self.funnel = FunnelModel(config)
         self.dropout = nn.Dropout(p=config.hidden_dropout)
         self.classifier = nn.Linear(config.hidden_size, config.num_labels)
+        self.ce_loss = nn.CrossEntropyLoss()
 
         # Initialize weights and apply final processing
         self.post_init()
@@ -1257,9 +1594,7 @@ class FunnelForTokenClassification(FunnelPreTrainedModel):
 
         loss = None
         if labels is not None:
-            loss_fct = nn.CrossEntropyLoss()
-            labels = labels.astype(mindspore.int32)
-            loss = loss_fct(logits.view(-1, self.num_labels), labels.view(-1))
+            loss = _ce_loss(self.ce_loss, logits, labels, self.num_labels)
 
         if not return_dict:
             output = (logits,) + outputs[1:]
@@ -1280,6 +1615,10 @@ class FunnelForQuestionAnswering(FunnelPreTrainedModel):
 
         self.funnel = FunnelModel(config)
         self.qa_outputs = nn.Linear(config.hidden_size, config.num_labels)
+        # The QA loss's ignore_index depends on the sequence length, so the loss
+        # module is built lazily and reused for as long as the length is stable.
+        self._qa_loss_fct = None
+        self._qa_ignored_index = None
 
         # Initialize weights and apply final processing
         self.post_init()
@@ -1322,15 +1661,13 @@ class FunnelForQuestionAnswering(FunnelPreTrainedModel):
         last_hidden_state = outputs[0]
 
         logits = self.qa_outputs(last_hidden_state)
-        start_logits, end_logits = logits.split(1, axis=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = ops.unbind(logits, -1)
 
         total_loss = None
         if start_positions is not None and end_positions is not None:
             # If we are on multi-GPU, split add a dimension
             if len(start_positions.shape) > 1:
-                start_positions = start_positions.squeze(-1)
+                start_positions = start_positions.squeeze(-1)
             if len(end_positions.shape) > 1:
                 end_positions = end_positions.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
@@ -1338,10 +1675,15 @@ class FunnelForQuestionAnswering(FunnelPreTrainedModel):
             start_positions = start_positions.clamp(0, ignored_index)
             end_positions = end_positions.clamp(0, ignored_index)
 
-            loss_fct = nn.CrossEntropyLoss(ignore_index=ignored_index)
-            start_positions = start_positions.astype(mindspore.int32)
+            if self._qa_ignored_index != ignored_index:
+                self._qa_loss_fct = nn.CrossEntropyLoss(ignore_index=ignored_index)
+                self._qa_ignored_index = ignored_index
+            loss_fct = self._qa_loss_fct
+            if start_positions.dtype != mindspore.int32:
+                start_positions = start_positions.astype(mindspore.int32)
+            if end_positions.dtype != mindspore.int32:
+                end_positions = end_positions.astype(mindspore.int32)
             start_loss = loss_fct(start_logits, start_positions)
-            end_positions = end_positions.astype(mindspore.int32)
             end_loss = loss_fct(end_logits, end_positions)
             total_loss = (start_loss + end_loss) / 2
 
@@ -214,6 +214,73 @@ class FunnelModelTester:
         result = model(input_ids)
         self.parent.assertEqual(result.last_hidden_state.shape, (self.batch_size, 2, self.d_model))
 
+    def create_and_check_quantized_model(
+        self,
+        config,
+        input_ids,
+        token_type_ids,
+        input_mask,
+        sequence_labels,
+        token_labels,
+        choice_labels,
+        fake_token_labels,
+    ):
+        model = FunnelModel(config=config)
+        model.set_train(False)
+        model.quantize()
+        result = model(input_ids, attention_mask=input_mask, token_type_ids=token_type_ids)
+        self.parent.assertEqual(result.last_hidden_state.shape, (self.batch_size, self.seq_length, self.d_model))
+
+    def create_and_check_encoder_outputs_reuse(
+        self,
+        config,
+        input_ids,
+        token_type_ids,
+        input_mask,
+        sequence_labels,
+        token_labels,
+        choice_labels,
+        fake_token_labels,
+    ):
+        model = FunnelModel(config=config)
+        model.set_train(False)
+        expected = model(input_ids, attention_mask=input_mask, token_type_ids=token_type_ids)
+        encoder_outputs = model.encoder(
+            model.embeddings(input_ids),
+            attention_mask=input_mask,
+            token_type_ids=token_type_ids,
+            output_hidden_states=True,
+        )
+        result = model(
+            input_ids,
+            attention_mask=input_mask,
+            token_type_ids=token_type_ids,
+            encoder_outputs=encoder_outputs,
+        )
+        self.parent.assertTrue(
+            np.allclose(result.last_hidden_state.asnumpy(), expected.last_hidden_state.asnumpy(), atol=1e-5)
+        )
+
+    def create_and_check_precomputed_embeddings(
+        self,
+        config,
+        input_ids,
+        token_type_ids,
+        input_mask,
+        sequence_labels,
+        token_labels,
+        choice_labels,
+        fake_token_labels,
+    ):
+        model = FunnelModel(config=config)
+        model.set_train(False)
+        expected = model(input_ids, attention_mask=input_mask, token_type_ids=token_type_ids)
+        model.embeddings.precompute_token_embeddings()
+        result = model(input_ids, attention_mask=input_mask, token_type_ids=token_type_ids)
+        self.parent.assertTrue(
+            np.allclose(result.last_hidden_state.asnumpy(), expected.last_hidden_state.asnumpy(), atol=1e-5)
+        )
+
     def create_and_check_for_pretraining(
         self,
         config,
@@ -395,6 +462,18 @@ class FunnelModelTest(ModelTesterMixin, unittest.TestCase):
         config_and_inputs = self.model_tester.prepare_config_and_inputs()
         self.model_tester.create_and_check_model(*config_and_inputs)
 
+    def test_quantized_model(self):
+        config_and_inputs = self.model_tester.prepare_config_and_inputs()
+        self.model_tester.create_and_check_quantized_model(*config_and_inputs)
+
+    def test_encoder_outputs_reuse(self):
+        config_and_inputs = self.model_tester.prepare_config_and_inputs()
+        self.model_tester.create_and_check_encoder_outputs_reuse(*config_and_inputs)
+
+    def test_precomputed_embeddings(self):
+        config_and_inputs = self.model_tester.prepare_config_and_inputs()
+        self.model_tester.create_and_check_precomputed_embeddings(*config_and_inputs)
+
     def test_for_pretraining(self):
         config_and_inputs = self.model_tester.prepare_config_and_inputs()
         self.model_tester.create_and_check_for_pretraining(*config_and_inputs)